@@ -1,14 +1,14 @@
 import streamlit as st
-import tempfile
 import os
 import time
-import numpy as np
-import librosa
-import tensorflow as tf
-from tensorflow.keras.models import load_model
 import wave
 import io
+import hashlib
+import numpy as np
 import pyaudio
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from predictor import get_predictor, load_audio, load_pcm, compute_features
 
 # 页面配置
 st.set_page_config(
@@ -78,66 +78,26 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class BronchitisPredictor:
-    def __init__(self, model_path="models/bronchitis_model.h5"):
-        try:
-            if os.path.exists(model_path):
-                self.model = load_model(model_path)
-                self.label_encoder = np.load("models/label_encoder.npy", allow_pickle=True)
-                self.max_pad_len = 174
-            else:
-                st.error("❌ 模型文件未找到！请确保模型文件位于 models/ 目录下")
-                self.model = None
-        except Exception as e:
-            st.error(f"❌ 模型加载失败: {str(e)}")
-            self.model = None
-
-    def extract_features(self, audio_path):
-        try:
-            audio, sample_rate = librosa.load(audio_path, sr=22050, duration=3.0)
-            mfccs = librosa.feature.mfcc(y=audio, sr=sample_rate, n_mfcc=40)
-            pad_width = self.max_pad_len - mfccs.shape[1]
-            if pad_width < 0:
-                mfccs = mfccs[:, :self.max_pad_len]
-            else:
-                mfccs = np.pad(mfccs, pad_width=((0, 0), (0, pad_width)), mode='constant')
-            return mfccs
-        except Exception as e:
-            st.error(f"❌ 音频处理错误: {str(e)}")
-            return None
-
-    def predict(self, audio_path):
-        if self.model is None:
-            st.error("❌ 模型未正确加载，无法进行分析")
-            return "Error: Model not loaded", 0.0
-        
-        features = self.extract_features(audio_path)
-        if features is None:
-            return "Error: Could not process audio file", 0.0
-
-        features = features[np.newaxis, ..., np.newaxis]
-        prediction = self.model.predict(features, verbose=0)
-        predicted_index = np.argmax(prediction)
-        predicted_label = self.label_encoder[predicted_index]
-        confidence = np.max(prediction)
-
-        # 计算支气管炎风险概率
-        bronchitis_prob = 0.0
-        if predicted_label == "bronchitis":
-            bronchitis_prob = confidence
-        elif predicted_label == "healthy_breath":
-            bronchitis_prob = 1 - confidence
-        elif predicted_label == "healthy_voice":
-            bronchitis_idx = np.where(self.label_encoder == "bronchitis")[0][0]
-            bronchitis_prob = prediction[0][bronchitis_idx]
-
-        return predicted_label, float(bronchitis_prob)
-
 def record_audio(duration=5, sample_rate=44100):
     """录制音频"""
     CHUNK = 1024
     FORMAT = pyaudio.paInt16
     CHANNELS = 1
+    total_samples = int(sample_rate / CHUNK * duration) * CHUNK
+    
+    # 预分配 int16 缓冲区，回调直接按偏移写入
+    buffer = np.empty(total_samples, dtype=np.int16)
+    offset = 0
+    
+    def callback(in_data, frame_count, time_info, status):
+        # PortAudio 在自己的线程中回调，这里只保存数据
+        nonlocal offset
+        n = min(frame_count, total_samples - offset)
+        buffer[offset:offset + n] = np.frombuffer(in_data, dtype=np.int16)[:n]
+        offset += n
+        if offset >= total_samples:
+            return (None, pyaudio.paComplete)
+        return (None, pyaudio.paContinue)
     
     audio = pyaudio.PyAudio()
     
@@ -146,22 +106,25 @@ def record_audio(duration=5, sample_rate=44100):
         channels=CHANNELS,
         rate=sample_rate,
         input=True,
-        frames_per_buffer=CHUNK
+        frames_per_buffer=CHUNK,
+        stream_callback=callback
     )
     
-    frames = []
-    
     # 显示录音状态
     status_placeholder = st.empty()
     progress_bar = st.progress(0)
     
-    # 录音过程
-    for i in range(0, int(sample_rate / CHUNK * duration)):
-        data = stream.read(CHUNK)
-        frames.append(data)
+    # 录音过程（主线程只负责定时刷新进度）
+    # 设备停止回调（拔出、驱动卡住）时回调不会结束录音，超过时长加余量后放弃
+    deadline = time.monotonic() + duration + 2.0
+    stream.start_stream()
+    while stream.is_active():
+        if time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
         
         # 更新进度
-        progress = (i + 1) / int(sample_rate / CHUNK * duration)
+        progress = offset / total_samples
         progress_bar.progress(progress)
         status_placeholder.markdown(
             f'<div class="recording-status recording-active">'
@@ -170,6 +133,15 @@ def record_audio(duration=5, sample_rate=44100):
             unsafe_allow_html=True
         )
     
+    # 停止流
+    stream.stop_stream()
+    stream.close()
+    audio.terminate()
+    
+    if offset < total_samples:
+        status_placeholder.empty()
+        raise RuntimeError("录音设备无响应，未能录满设定时长")
+    
     status_placeholder.markdown(
         '<div class="recording-status" style="background: #00C851; color: white;">'
         '✅ 录音完成！'
@@ -177,18 +149,17 @@ def record_audio(duration=5, sample_rate=44100):
         unsafe_allow_html=True
     )
     
-    # 停止流
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-    
-    # 保存到内存中的WAV文件
+    # 返回 int16 PCM 数组
+    return buffer[:offset]
+
+def pcm_to_wav(pcm_bytes, sample_rate):
+    """将 16 位单声道 PCM 数据封装为 WAV（仅用于页面播放）"""
     wav_buffer = io.BytesIO()
     with wave.open(wav_buffer, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(audio.get_sample_size(FORMAT))
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
         wf.setframerate(sample_rate)
-        wf.writeframes(b''.join(frames))
+        wf.writeframes(pcm_bytes)
     
     wav_buffer.seek(0)
     return wav_buffer.getvalue()
@@ -274,20 +245,42 @@ def display_results(label, risk):
         - 评估时间: {time.strftime('%Y-%m-%d %H:%M:%S')}
         """)
 
-def analyze_audio_file(audio_path):
-    """分析音频文件"""
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_features(digest, sample_rate, _audio_bytes):
+    """按音频内容缓存特征；sample_rate 为 None 时 _audio_bytes 是带文件头的音频文件"""
+    if sample_rate is not None:
+        return compute_features(load_pcm(_audio_bytes, sample_rate))
+    # 直接从内存解码，不写临时文件
+    return compute_features(load_audio(io.BytesIO(_audio_bytes)))
+
+def _features_for(audio_bytes, sample_rate=None):
+    """计算音频特征，相同内容重复分析时直接使用缓存（以 blake2b 哈希为键）"""
+    digest = hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+    return _cached_features(digest, sample_rate, audio_bytes)
+
+def run_analysis(extract):
+    """提取特征、加载预测器并显示分析结果，extract 返回模型输入特征"""
     with st.spinner("🔬 分析音频中，请稍候..."):
         try:
-            # 加载预测器
-            predictor = BronchitisPredictor()
+            # 特征提取与模型加载/预热互不依赖，冷启动时并行执行
+            # 特征线程需要当前会话的上下文才能使用 st.cache_data
+            with ThreadPoolExecutor(max_workers=1, initializer=add_script_run_ctx,
+                                    initargs=(None, get_script_run_ctx())) as executor:
+                features_future = executor.submit(extract)
+                predictor = get_predictor()
+                try:
+                    features = features_future.result()
+                except Exception as e:
+                    st.error(f"❌ 音频处理错误: {str(e)}")
+                    return
             
             # 检查模型是否加载成功
-            if predictor.model is None:
+            if not predictor.ready:
                 st.error("❌ 无法进行分析，模型加载失败")
                 return
             
             # 进行预测
-            label, risk = predictor.predict(audio_path)
+            label, risk = predictor.predict_features(features)
             
             # 显示结果
             display_results(label, risk)
@@ -297,31 +290,12 @@ def analyze_audio_file(audio_path):
 
 def analyze_uploaded_file(uploaded_file):
     """分析上传的音频文件"""
-    # 保存临时文件
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        audio_path = tmp_file.name
-    
-    try:
-        analyze_audio_file(audio_path)
-    finally:
-        # 清理临时文件
-        if os.path.exists(audio_path):
-            os.unlink(audio_path)
+    audio_bytes = uploaded_file.getvalue()
+    run_analysis(lambda: _features_for(audio_bytes))
 
-def analyze_recorded_audio(audio_data):
-    """分析录制的音频"""
-    # 保存临时文件
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-        tmp_file.write(audio_data)
-        audio_path = tmp_file.name
-    
-    try:
-        analyze_audio_file(audio_path)
-    finally:
-        # 清理临时文件
-        if os.path.exists(audio_path):
-            os.unlink(audio_path)
+def analyze_recorded_audio(audio_data, sample_rate):
+    """分析录制的音频（直接使用内存中的PCM数据）"""
+    run_analysis(lambda: _features_for(audio_data, sample_rate))
 
 def main():
     st.title("🏥 支气管炎风险检测系统")
@@ -383,10 +357,10 @@ def main():
                     audio_data = record_audio(duration, sample_rate)
                     
                     # 显示录制的音频
-                    st.audio(audio_data, format='audio/wav')
+                    st.audio(pcm_to_wav(audio_data.tobytes(), sample_rate), format='audio/wav')
                     
                     # 分析录音
-                    analyze_recorded_audio(audio_data)
+                    analyze_recorded_audio(audio_data, sample_rate)
                     
                 except Exception as e:
                     st.error(f"❌ 录音失败: {str(e)}")
@@ -455,7 +429,9 @@ def main():
         st.header("🔧 系统状态")
         
         # 检查模型文件是否存在
-        model_exists = os.path.exists("models/bronchitis_model.h5")
+        # 只有 .h5 模型时会在首次分析时自动转换为 .tflite
+        model_exists = (os.path.exists("models/bronchitis_model.tflite")
+                        or os.path.exists("models/bronchitis_model.h5"))
         encoder_exists = os.path.exists("models/label_encoder.npy")
         pyaudio_available = True
         
@@ -471,7 +447,7 @@ def main():
         else:
             st.error("❌ 模型文件缺失")
             if not model_exists:
-                st.error("缺少: models/bronchitis_model.h5")
+                st.error("缺少: models/bronchitis_model.tflite 或 models/bronchitis_model.h5")
             if not encoder_exists:
                 st.error("缺少: models/label_encoder.npy")
         
@@ -0,0 +1,41 @@
+"""
+将 Keras .h5 模型离线转换为 TFLite 模型
+
+用法: python convert_model.py [--quantize fp16|int8|none] [h5路径] [tflite路径]
+"""
+import argparse
+import tempfile
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+def convert(h5_path="models/bronchitis_model.h5", tflite_path="models/bronchitis_model.tflite", quantize="fp16"):
+    """转换模型
+
+    quantize:
+        fp16 - 权重存为 float16，CPU 上由 XNNPACK 以 float32 SIMD 内核执行（默认）
+        int8 - INT8 动态范围量化，体积最小，但在部分 x86 CPU 上可能更慢
+        none - 不量化，保持 float32
+    """
+    model = load_model(h5_path)
+    # 先导出为 SavedModel 再转换：Keras 3 下 from_keras_model 转换 Conv1D 模型时会崩溃
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        if quantize in ("fp16", "int8"):
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantize == "fp16":
+            converter.target_spec.supported_types = [tf.float16]
+        # 输入输出始终为 float32
+        tflite_model = converter.convert()
+
+    with open(tflite_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"✅ 已生成 {tflite_path} ({len(tflite_model) / 1024:.1f} KB, {quantize})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将 Keras .h5 模型转换为 TFLite 模型")
+    parser.add_argument("h5_path", nargs="?", default="models/bronchitis_model.h5")
+    parser.add_argument("tflite_path", nargs="?", default="models/bronchitis_model.tflite")
+    parser.add_argument("--quantize", choices=["fp16", "int8", "none"], default="fp16")
+    args = parser.parse_args()
+    convert(args.h5_path, args.tflite_path, args.quantize)
@@ -0,0 +1,97 @@
+"""
+独立推理进程：加载 TFLite 模型，合并并发请求后批量推理
+
+由 predictor 以 spawn 方式启动，启动时不会重新执行 app.py，因此进程内不加载 Streamlit，
+也不占用主进程的 GIL。安装了 ai-edge-litert 或 tflite-runtime 时只依赖 numpy 和轻量解释器，
+常驻内存约 45 MB；否则（Windows、macOS、Python 3.13 及以上）会回退到完整的 TensorFlow，
+推理进程的常驻内存约 550 MB
+"""
+import queue
+import time
+import numpy as np
+
+# 动态批处理参数：最多攒 BATCH_MAX_SIZE 个请求，最长等待 BATCH_MAX_WAIT 秒
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT = 0.02
+
+def _load_interpreter(model_path, num_threads):
+    """创建 TFLite 解释器，回退到 tf.lite 时会在本进程中导入完整的 TensorFlow"""
+    # 优先使用轻量的 LiteRT（ai-edge-litert）解释器，其次是旧的 tflite-runtime，
+    # 都未安装时回退到 TensorFlow 自带的实现
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+class BatchRunner:
+    def __init__(self, model_path, num_threads):
+        # TFLite 模型（由 convert_model.py 离线生成），CPU 上默认使用 XNNPACK 加速
+        self.interpreter = _load_interpreter(model_path, num_threads)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self._batch_size = 1
+        # 预分配的模型输入缓冲区，形状取自模型本身的输入（不含批维度）
+        self._feat_buf = np.zeros((BATCH_MAX_SIZE, *input_details['shape'][1:]), dtype=np.float32)
+        # 用全零输入预先跑一遍推理，避免首次请求的冷启动延迟
+        self._run_batch(self._feat_buf[:1])
+
+    def _run_batch(self, batch):
+        """对一个批次执行推理，批大小变化时重新分配输入张量"""
+        if batch.shape[0] != self._batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch.shape[0]
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+    def run(self, features_list):
+        """将各请求的特征写入预分配缓冲区并推理，返回 (批大小, 类别数) 的概率"""
+        batch = self._feat_buf[:len(features_list)]
+        for i, features in enumerate(features_list):
+            batch[i] = features.reshape(batch.shape[1:])
+        return self._run_batch(batch)
+
+def _collect(requests):
+    """阻塞等待第一个请求，再在等待窗口内尽量多取几个"""
+    items = [requests.get()]
+    deadline = time.monotonic() + BATCH_MAX_WAIT
+    while len(items) < BATCH_MAX_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            items.append(requests.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return items
+
+def serve(model_path, num_threads, requests, results):
+    """推理进程入口
+
+    requests 接收 (请求ID, 特征)，results 返回 (请求ID, 概率, 错误信息)；
+    启动完成后先发送一条请求ID为 None 的就绪消息
+    """
+    try:
+        runner = BatchRunner(model_path, num_threads)
+    except Exception as e:
+        results.put((None, None, str(e)))
+        return
+    results.put((None, None, None))
+
+    while True:
+        items = _collect(requests)
+        try:
+            prediction = runner.run([features for _, features in items])
+            for i, (request_id, _) in enumerate(items):
+                results.put((request_id, prediction[i].copy(), None))
+        except Exception as e:
+            for request_id, _ in items:
+                results.put((request_id, None, str(e)))
@@ -0,0 +1,306 @@
+import streamlit as st
+import os
+import sys
+import types
+import contextlib
+import tempfile
+import itertools
+import queue
+import time
+import multiprocessing
+import threading
+import numpy as np
+import librosa
+import soundfile as sf
+import tensorflow as tf
+from scipy.signal import resample_poly
+from inference_worker import serve
+from convert_model import convert
+
+def _default_num_threads():
+    """进程可用的 CPU 数（考虑容器的 CPU 亲和性限制）"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 4
+
+# 线程数与进程可用的 CPU 数一致，可通过 TF_INTRA 环境变量覆盖
+NUM_THREADS = int(os.environ.get("TF_INTRA", _default_num_threads()))
+
+# 须在 TensorFlow 运行时初始化前设置；Streamlit 重新加载本模块时运行时已初始化，沿用首次的设置
+try:
+    tf.config.threading.set_intra_op_parallelism_threads(NUM_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+except RuntimeError:
+    pass
+
+# 音频特征参数（与训练时 librosa.feature.mfcc 的默认参数一致）
+SAMPLE_RATE = 22050
+DURATION = 3.0
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 40
+MAX_PAD_LEN = 174
+
+# 等待推理进程启动、等待单次推理结果的超时时间（秒）
+WORKER_START_TIMEOUT = 120
+INFER_TIMEOUT = 30
+# 等待期间检查推理进程是否存活的间隔（秒）
+WORKER_POLL_INTERVAL = 0.5
+
+# librosa 的 Slaney mel 滤波器组，只在启动时计算一次
+MEL_WEIGHTS = tf.constant(
+    librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS).T, dtype=tf.float32
+)
+
+@tf.function(input_signature=[tf.TensorSpec([None], tf.float32)])
+def mfcc_fn(audio):
+    """TensorFlow 版 MFCC，结果与 librosa.feature.mfcc 一致，形状为 (帧数, N_MFCC)"""
+    # center=True：两端各补 N_FFT // 2 个零
+    audio = tf.pad(audio, [[N_FFT // 2, N_FFT // 2]])
+    stft = tf.signal.stft(audio, frame_length=N_FFT, frame_step=HOP_LENGTH, fft_length=N_FFT)
+    mel = tf.matmul(tf.square(tf.abs(stft)), MEL_WEIGHTS)
+    # power_to_db(ref=1.0, amin=1e-10, top_db=80)
+    log_mel = 10.0 * tf.math.log(tf.maximum(mel, 1e-10)) / tf.math.log(10.0)
+    log_mel = tf.maximum(log_mel, tf.reduce_max(log_mel) - 80.0)
+    return tf.signal.dct(log_mel, type=2, norm='ortho')[:, :N_MFCC]
+
+# 输入长度随采样率和上传文件变化，不使用 jit_compile，避免 XLA 为每种长度各编译一次
+@tf.function(input_signature=[tf.TensorSpec([None], tf.float32)])
+def features_fn(audio):
+    """音频 -> 模型输入 (N_MFCC, MAX_PAD_LEN)，MFCC、转置和截断/补零在同一个图中完成"""
+    mfccs = tf.transpose(mfcc_fn(audio))[:, :MAX_PAD_LEN]
+    mfccs = tf.pad(mfccs, [[0, 0], [0, MAX_PAD_LEN - tf.shape(mfccs)[1]]])
+    return tf.ensure_shape(mfccs, [N_MFCC, MAX_PAD_LEN])
+
+def _load_with_audioread(source):
+    """libsndfile 不支持的格式（如 m4a）交给 librosa/audioread 解码，audioread 只能读取文件路径"""
+    if isinstance(source, (str, os.PathLike)):
+        return librosa.load(source, sr=None, duration=DURATION)
+
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_file.write(source.read())
+        audio_path = tmp_file.name
+    try:
+        return librosa.load(audio_path, sr=None, duration=DURATION)
+    finally:
+        os.unlink(audio_path)
+
+def load_audio(source):
+    """读取音频（文件路径或文件对象）为单声道 float32，重采样到 SAMPLE_RATE，截取前 DURATION 秒"""
+    try:
+        # 只解码前 DURATION 秒，长文件不必整个读入内存
+        with sf.SoundFile(source) as f:
+            sample_rate = f.samplerate
+            audio = f.read(frames=int(sample_rate * DURATION), dtype='float32')
+    except sf.LibsndfileError:
+        audio, sample_rate = _load_with_audioread(source)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    audio = audio[:int(sample_rate * DURATION)]
+    if sample_rate != SAMPLE_RATE:
+        audio = resample_poly(audio, SAMPLE_RATE, sample_rate).astype(np.float32)
+    return audio
+
+def load_pcm(pcm_bytes, sample_rate):
+    """将录音得到的 16 位单声道 PCM 数据（bytes 或 int16 数组）转换为 float32 并重采样"""
+    audio = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+    audio = audio[:int(sample_rate * DURATION)]
+    if sample_rate != SAMPLE_RATE:
+        audio = resample_poly(audio, SAMPLE_RATE, sample_rate).astype(np.float32)
+    return audio
+
+def compute_features(audio):
+    """计算模型输入特征，返回 (N_MFCC, MAX_PAD_LEN)"""
+    return features_fn(audio).numpy()
+
+class BronchitisPredictor:
+    def __init__(self, model_path="models/bronchitis_model.tflite"):
+        self._loaded = False
+        self._process = None
+        try:
+            # 只有 .h5 模型时，首次加载自动转换为 .tflite
+            h5_path = os.path.splitext(model_path)[0] + ".h5"
+            if not os.path.exists(model_path) and os.path.exists(h5_path):
+                with st.spinner("⚙️ 首次运行，正在将 .h5 模型转换为 TFLite..."):
+                    convert(h5_path, model_path)
+            if os.path.exists(model_path):
+                self.label_encoder = np.load("models/label_encoder.npy", allow_pickle=True)
+                self.max_pad_len = MAX_PAD_LEN
+                self.label_to_idx = {str(label): i for i, label in enumerate(self.label_encoder)}
+                self.bronchitis_idx = self.label_to_idx.get("bronchitis", -1)
+                # 用全零输入预先跑一遍特征提取，避免首次请求的冷启动延迟
+                features_fn(np.zeros(int(SAMPLE_RATE * DURATION), dtype=np.float32))
+                self._start_worker(model_path)
+                self._loaded = True
+            else:
+                st.error("❌ 模型文件未找到！请确保模型文件位于 models/ 目录下")
+        except Exception as e:
+            st.error(f"❌ 模型加载失败: {str(e)}")
+
+    @property
+    def ready(self):
+        """模型已加载且推理进程仍在运行"""
+        return self._loaded and self._process.is_alive()
+
+    def _worker_exited_error(self):
+        return RuntimeError(f"推理进程已退出（退出码 {self._process.exitcode}），请重试")
+
+    def _start_worker(self, model_path):
+        """启动推理进程，所有会话共享；使用 spawn 避免复制已初始化的 TensorFlow 运行时"""
+        ctx = multiprocessing.get_context("spawn")
+        self._requests = ctx.Queue()
+        self._results = ctx.Queue()
+        self._process = ctx.Process(
+            target=serve,
+            args=(model_path, NUM_THREADS, self._requests, self._results),
+            daemon=True
+        )
+        with _without_main_module():
+            self._process.start()
+
+        try:
+            error = self._wait_until_ready()
+        except Exception:
+            self._shutdown_worker()
+            raise
+        if error is not None:
+            self._shutdown_worker()
+            raise RuntimeError(error)
+
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        threading.Thread(target=self._dispatch_results, daemon=True).start()
+
+    def _wait_until_ready(self):
+        """等待就绪消息，返回启动错误信息（成功时为 None），同时检查子进程是否在启动阶段崩溃"""
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while True:
+            try:
+                _, _, error = self._results.get(timeout=WORKER_POLL_INTERVAL)
+                return error
+            except queue.Empty:
+                pass
+            if not self._process.is_alive():
+                # 子进程可能刚发出错误信息就退出，先取出队列中的消息再判定
+                try:
+                    _, _, error = self._results.get_nowait()
+                    return error
+                except queue.Empty:
+                    raise self._worker_exited_error()
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"推理进程启动超时（{WORKER_START_TIMEOUT} 秒）")
+
+    def _shutdown_worker(self):
+        """结束推理进程并关闭队列"""
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join(timeout=WORKER_POLL_INTERVAL)
+        self._requests.close()
+        self._results.close()
+
+    def _dispatch_results(self):
+        """后台线程：把推理进程返回的结果交给对应的等待请求，推理进程退出后结束"""
+        while True:
+            try:
+                request_id, prediction, error = self._results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    self._shutdown_worker()
+                    return
+                continue
+            with self._pending_lock:
+                slot = self._pending.pop(request_id, None)
+            # 已超时放弃的请求直接丢弃
+            if slot is None:
+                continue
+            slot['prediction'] = prediction
+            slot['error'] = error
+            slot['event'].set()
+
+    def _infer(self, features):
+        """提交到推理进程并等待结果；推理进程退出后 ready 变为 False，get_predictor 会重新加载"""
+        if not self._process.is_alive():
+            raise self._worker_exited_error()
+
+        request_id = next(self._request_ids)
+        slot = {'event': threading.Event()}
+        with self._pending_lock:
+            self._pending[request_id] = slot
+        self._requests.put((request_id, features))
+
+        deadline = time.monotonic() + INFER_TIMEOUT
+        while not slot['event'].wait(WORKER_POLL_INTERVAL):
+            if not self._process.is_alive() or time.monotonic() > deadline:
+                with self._pending_lock:
+                    self._pending.pop(request_id, None)
+                if not self._process.is_alive():
+                    raise self._worker_exited_error()
+                raise TimeoutError("推理进程无响应")
+        if slot['error'] is not None:
+            raise RuntimeError(slot['error'])
+        return slot['prediction']
+
+    def extract_features(self, audio_path):
+        try:
+            return compute_features(load_audio(audio_path))
+        except Exception as e:
+            st.error(f"❌ 音频处理错误: {str(e)}")
+            return None
+
+    def predict(self, audio_path):
+        return self.predict_features(self.extract_features(audio_path))
+
+    def predict_features(self, features):
+        if not self.ready:
+            st.error("❌ 模型未正确加载，无法进行分析")
+            return "Error: Model not loaded", 0.0
+        if features is None:
+            return "Error: Could not process audio file", 0.0
+
+        probs = self._infer(features)
+        predicted_index = int(probs.argmax())
+        predicted_label = self.label_encoder[predicted_index]
+        confidence = float(probs[predicted_index])
+
+        # 计算支气管炎风险概率
+        bronchitis_prob = 0.0
+        if predicted_index == self.bronchitis_idx:
+            bronchitis_prob = confidence
+        elif predicted_label == "healthy_breath":
+            bronchitis_prob = 1 - confidence
+        elif predicted_label == "healthy_voice" and self.bronchitis_idx >= 0:
+            bronchitis_prob = float(probs[self.bronchitis_idx])
+
+        return predicted_label, bronchitis_prob
+
+@contextlib.contextmanager
+def _without_main_module():
+    """spawn 会在子进程中重新执行 __main__（Streamlit 下即 app.py），启动期间临时替换为空模块，
+    让推理进程只导入 inference_worker，不加载 Streamlit 和 TensorFlow"""
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+@st.cache_resource
+def _load_predictor(model_path):
+    return BronchitisPredictor(model_path)
+
+def get_predictor(model_path="models/bronchitis_model.tflite"):
+    """获取预测器（每个进程只加载一次模型；加载失败时不缓存，下次调用重新加载）"""
+    predictor = _load_predictor(model_path)
+    if predictor.ready:
+        return predictor
+
+    _load_predictor.clear()
+    # 模型曾加载成功、只是推理进程已退出时立即重启，本次分析即可使用新的推理进程
+    if predictor._loaded:
+        predictor = _load_predictor(model_path)
+        if not predictor.ready:
+            _load_predictor.clear()
+    return predictor
@@ -4,6 +4,7 @@ import wave
 import threading
 import time
 import io
+from collections import deque
 
 def record_audio_web(duration=5, sample_rate=44100):
     """
@@ -12,6 +13,16 @@ def record_audio_web(duration=5, sample_rate=44100):
     CHUNK = 1024
     FORMAT = pyaudio.paInt16
     CHANNELS = 1
+    total_chunks = int(sample_rate / CHUNK * duration)
+    
+    frames = deque()
+    
+    def callback(in_data, frame_count, time_info, status):
+        # PortAudio 在自己的线程中回调，这里只保存数据
+        frames.append(in_data)
+        if len(frames) >= total_chunks:
+            return (None, pyaudio.paComplete)
+        return (None, pyaudio.paContinue)
     
     audio = pyaudio.PyAudio()
     
@@ -21,34 +32,40 @@ def record_audio_web(duration=5, sample_rate=44100):
         channels=CHANNELS,
         rate=sample_rate,
         input=True,
-        frames_per_buffer=CHUNK
+        frames_per_buffer=CHUNK,
+        stream_callback=callback
     )
     
     st.info("🎙️ 录音中... 请说话或呼吸")
     
-    frames = []
-    
     # 创建进度条
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    # 录音过程
-    for i in range(0, int(sample_rate / CHUNK * duration)):
-        data = stream.read(CHUNK)
-        frames.append(data)
+    # 录音过程（主线程只负责定时刷新进度）
+    # 设备停止回调（拔出、驱动卡住）时回调不会结束录音，超过时长加余量后放弃
+    deadline = time.monotonic() + duration + 2.0
+    stream.start_stream()
+    while stream.is_active():
+        if time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
         
         # 更新进度
-        progress = (i + 1) / int(sample_rate / CHUNK * duration)
+        progress = min(len(frames) / total_chunks, 1.0)
         progress_bar.progress(progress)
         status_text.text(f"录音进度: {int(progress * 100)}%")
     
-    status_text.text("✅ 录音完成！")
-    
     # 停止流
     stream.stop_stream()
     stream.close()
     audio.terminate()
     
+    if len(frames) < total_chunks:
+        raise RuntimeError("录音设备无响应，未能录满设定时长")
+    
+    status_text.text("✅ 录音完成！")
+    
     # 保存到内存中的WAV文件
     wav_buffer = io.BytesIO()
     with wave.open(wav_buffer, 'wb') as wf: